@@ -1,24 +1,54 @@
+import ahocorasick
+from typing import Iterable
+
 CATEGORIES = ["Finance", "HR", "Legal", "Contracts", "Technical", "General"]
 
+# Keyword sets for each category, in priority order
+KEYWORDS = {
+    "Finance": ["invoice", "financial", "report", "budget", "quarterly", "revenue", "expense", "profit"],
+    "HR": ["employee", "handbook", "policy", "onboarding", "leave", "benefits", "hr department"],
+    "Legal": ["legal", "agreement", "contract", "terms", "conditions", "lawsuit", "compliance"],
+    "Contracts": ["contract", "agreement", "clause", "signing", "party", "effective date"],
+    "Technical": ["api", "documentation", "technical", "code", "server", "database", "engineering"],
+}
+
+def _build_automaton() -> ahocorasick.Automaton:
+    automaton = ahocorasick.Automaton()
+    # Walk categories in reverse so a term shared by several categories
+    # ends up mapped to the highest-priority one
+    for priority, (category, terms) in reversed(list(enumerate(KEYWORDS.items()))):
+        for term in terms:
+            automaton.add_word(term, (priority, category))
+    automaton.make_automaton()
+    return automaton
+
+_AUTOMATON = _build_automaton()
+
+def classify_chunks(chunks: Iterable[str]) -> str:
+    """
+    Classifies a document given as a sequence of text chunks (e.g. pages).
+    Matcher state carries across chunks, so keywords split over a chunk
+    boundary are still found.
+    """
+    best = None
+    search = _AUTOMATON.iter("")
+    for chunk in chunks:
+        search.set(chunk.lower())
+        # Keep the highest-priority category seen so far
+        for _, (priority, category) in search:
+            if best is None or priority < best[0]:
+                best = (priority, category)
+        if best is not None and best[0] == 0:
+            break
+
+    if best is not None:
+        return best[1]
+
+    # Default category if no keywords are found
+    return "General"
+
 def classify_document(text: str) -> str:
     """
     Classifies a document based on keyword matching.
     """
-    text_lower = text.lower()
-
-    # Keyword sets for each category
-    keywords = {
-        "Finance": ["invoice", "financial", "report", "budget", "quarterly", "revenue", "expense", "profit"],
-        "HR": ["employee", "handbook", "policy", "onboarding", "leave", "benefits", "hr department"],
-        "Legal": ["legal", "agreement", "contract", "terms", "conditions", "lawsuit", "compliance"],
-        "Contracts": ["contract", "agreement", "clause", "signing", "party", "effective date"],
-        "Technical": ["api", "documentation", "technical", "code", "server", "database", "engineering"],
-    }
-    
-    # Check for category-specific keywords
-    for category, terms in keywords.items():
-        if any(term in text_lower for term in terms):
-            return category
-    
-    # Default category if no keywords are found
-    return "General"
\ No newline at end of file
+    return classify_chunks([text])
\ No newline at end of file
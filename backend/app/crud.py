@@ -1,4 +1,9 @@
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
+from datetime import datetime
+import queue
+import threading
+import time
 from . import models
 
 class DocsCRUD():
@@ -11,6 +16,7 @@ class DocsCRUD():
             filename=filename,
             filepath=filepath,
             category=category,
+            category_lower=category.lower(),
             author=author,
             summary=summary
         )
@@ -25,11 +31,24 @@ class DocsCRUD():
     def fetch_doc_by_doc_id(self, doc_id: int):
         return self.db.query(models.Document).filter(models.Document.docid == doc_id).first()
 
+    def fetch_docs_by_doc_ids(self, doc_ids: list[int]):
+        return self.db.query(models.Document).filter(models.Document.docid.in_(doc_ids)).all()
+
+    def fetch_authors(self):
+        # Skip documents whose author fell back to the uploader's username
+        rows = (
+            self.db.query(models.Document.author)
+            .join(models.User, models.User.uuid == models.Document.uuid)
+            .filter(models.Document.author.isnot(None), models.Document.author != models.User.username)
+            .distinct()
+        )
+        return [author for (author,) in rows]
+
     def fetch_docs_by_user_id(self, user_uuid: str):
         return self.db.query(models.Document).filter(models.Document.uuid == user_uuid).all()
 
     def fetch_docs_by_role(self, role: str):
-        return self.db.query(models.Document).filter(models.Document.category == role).all()
+        return self.db.query(models.Document).filter(models.Document.category_lower == role.lower()).all()
 
     def delete_doc(self, doc_id: int):
         doc = self.fetch_doc_by_doc_id(doc_id)
@@ -59,19 +78,83 @@ class UserCRUD:
     def fetch_username(self, username: str):
         return self.db.query(models.User).filter(models.User.username == username).first()
     
+# Read-only: access logs are written in batches through LogWriter
 class LogCRUD:
     def __init__(self, db: Session):
         self.db = db
     
-    def log_action(self, user_uuid: str, action: str, doc_uuid: str = None):
-        log_entry = models.AccessLog(
-            user_uuid=user_uuid,
-            action=action,
-            doc_uuid=doc_uuid
-        )
-        self.db.add(log_entry)
-        self.db.commit()
-        return log_entry
-    
     def fetch_all_logs(self, skip: int = 0, limit: int = 100):
-        return self.db.query(models.AccessLog).offset(skip).limit(limit).all()
\ No newline at end of file
+        return self.db.query(models.AccessLog).offset(skip).limit(limit).all()
+
+class LogWriter:
+    """
+    Buffers access log entries and writes them from a background thread,
+    one bulk insert and commit per batch instead of one commit per action.
+    """
+    _STOP = object()
+
+    def __init__(self, session_factory, batch_size: int = 100, flush_interval: float = 0.5):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        # Drain whatever is queued, then let the worker exit
+        if self.thread is not None:
+            self.queue.put(self._STOP)
+            self.thread.join()
+            self.thread = None
+
+    def log_action(self, user_uuid: str, action: str, doc_uuid: str = None):
+        self.queue.put({
+            "user_uuid": user_uuid,
+            "action": action,
+            "doc_uuid": doc_uuid,
+            "timestamp": datetime.utcnow()
+        })
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            item = self.queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: list[dict], retries: int = 1):
+        # Transient errors (e.g. SQLite "database is locked" while another
+        # commit is in flight) get one more attempt before the batch is dropped
+        for attempt in range(retries + 1):
+            db = self.session_factory()
+            try:
+                db.execute(insert(models.AccessLog), batch)
+                db.commit()
+                return
+            except Exception as e:
+                db.rollback()
+                error = e
+            finally:
+                db.close()
+            if attempt < retries:
+                time.sleep(self.flush_interval)
+        print(f"Warning: Dropped {len(batch)} access log entries after {retries + 1} attempts: {str(error)}")
\ No newline at end of file
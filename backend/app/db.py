@@ -1,12 +1,20 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import sqlite3
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./documents.db"
 
+# Keep connections open between requests instead of reconnecting each time
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=QueuePool,
+    pool_size=20,
+    max_overflow=10,
+    pool_pre_ping=True,
+    pool_recycle=3600
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -20,6 +28,18 @@ def get_db():
     finally:
         db.close()
 
+def migrate_schema():
+    """
+    create_all doesn't alter existing tables, so add columns introduced
+    after the database was first created.
+    """
+    columns = {col["name"] for col in inspect(engine).get_columns("documents")}
+    with engine.begin() as conn:
+        if "category_lower" not in columns:
+            conn.execute(text("ALTER TABLE documents ADD COLUMN category_lower VARCHAR"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_documents_category_lower ON documents (category_lower)"))
+        conn.execute(text("UPDATE documents SET category_lower = lower(category) WHERE category_lower IS NULL"))
+
 def get_all_table_names():
     conn = sqlite3.connect(SQLALCHEMY_DATABASE_URL.replace("sqlite:///", ""))
     cursor = conn.cursor()
@@ -0,0 +1,75 @@
+import os
+import numpy as np
+import onnxruntime as ort
+from transformers import AutoTokenizer
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# Directory holding the exported tokenizer and the int8 ONNX model, see README
+ONNX_MODEL_DIR = os.getenv("EMBEDDING_ONNX_DIR", "onnx_model")
+ONNX_MODEL_FILE = "model_int8.onnx"
+
+# Matches SentenceTransformer's max_seq_length for all-MiniLM-L6-v2
+MAX_SEQ_LENGTH = 256
+
+class OnnxEmbedder:
+    """
+    Runs the embedding model as a dynamically quantized int8 ONNX graph on
+    ONNX Runtime, reproducing SentenceTransformer's mean pooling. encode()
+    accepts the same arguments main.py passes to SentenceTransformer.
+    """
+    def __init__(self, model_dir: str):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, ONNX_MODEL_FILE),
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        output_names = [o.name for o in self.session.get_outputs()]
+        # Exports made through sentence-transformers already include pooling
+        self.pooled_output = "sentence_embedding" if "sentence_embedding" in output_names else None
+
+    def _encode_batch(self, texts: list[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=MAX_SEQ_LENGTH, return_tensors="np"
+        )
+        inputs = {name: value.astype(np.int64) for name, value in encoded.items() if name in self.input_names}
+
+        if self.pooled_output:
+            return self.session.run([self.pooled_output], inputs)[0]
+
+        token_embeddings = self.session.run(None, inputs)[0]
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        return (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, texts: list[str], batch_size: int = 32, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False) -> np.ndarray:
+        # Batch texts of similar length together to minimize padding
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            batch_indices = order[start:start + batch_size]
+            batches.append(self._encode_batch([texts[i] for i in batch_indices]))
+
+        embeddings = np.empty((len(texts), batches[0].shape[1]), dtype=np.float32)
+        embeddings[order] = np.concatenate(batches)
+
+        if normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings
+
+def load_search_model():
+    """
+    Uses the int8 ONNX model when it has been exported, otherwise falls back
+    to SentenceTransformer (in FP16 when a GPU is available).
+    """
+    if os.path.exists(os.path.join(ONNX_MODEL_DIR, ONNX_MODEL_FILE)):
+        print("Loading quantized ONNX embedding model...")
+        return OnnxEmbedder(ONNX_MODEL_DIR)
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if torch.cuda.is_available():
+        return SentenceTransformer(MODEL_NAME, device='cuda').half()
+    return SentenceTransformer(MODEL_NAME)
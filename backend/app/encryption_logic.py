@@ -1,12 +1,64 @@
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.fernet import Fernet
+from argon2 import PasswordHasher
+from argon2.exceptions import VerifyMismatchError, InvalidHashError
+from functools import lru_cache
 import hashlib
 import base64
 import bcrypt
 import os
 
+# Leading byte of AES-GCM payloads. Legacy Fernet tokens are base64 text and
+# always start with b"g", so the formats can't be confused.
+AESGCM_VERSION = b"\x02"          # key from HKDF over the master key
+AESGCM_PBKDF2_VERSION = b"\x01"   # key from PBKDF2 over the password hash
+NONCE_SIZE = 12
+HKDF_INFO_PREFIX = b"doc-enc-v1:"
+
+def _load_master_key()->bytes:
+    encoded = os.getenv("ENC_MASTER_KEY")
+    if not encoded:
+        raise RuntimeError(
+            "ENC_MASTER_KEY is not set. Generate one with: "
+            "python -c \"import os, base64; print(base64.urlsafe_b64encode(os.urandom(32)).decode())\""
+        )
+    master_key = base64.urlsafe_b64decode(encoded)
+    if len(master_key) != 32:
+        raise RuntimeError("ENC_MASTER_KEY must decode to 32 bytes")
+    return master_key
+
+MASTER_KEY = _load_master_key()
+
+# KDF used for new password hashes ("argon2id" or "bcrypt"). Existing hashes
+# are verified by their own prefix, so switching this never locks users out.
+PASSWORD_KDF = os.getenv("PASSWORD_KDF", "argon2id")
+# Lower it (e.g. 4) in tests to keep user creation fast
+BCRYPT_COST = int(os.getenv("BCRYPT_COST", "12"))
+ARGON2_PREFIX = b"$argon2"
+
+password_hasher = PasswordHasher(time_cost=2, memory_cost=65536, parallelism=1)
+
+@lru_cache(maxsize=1024)
+def _derive_legacy_key_cached(password:bytes, salt:bytes, iterations:int)->bytes:
+    # Only needed to read documents encrypted before the switch to HKDF.
+    # Memoized per (hashed_password, salt) since PBKDF2 is expensive.
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        iterations=iterations,
+        backend=default_backend()
+    )
+    return kdf.derive(password)
+
+@lru_cache(maxsize=1024)
+def _get_cipher(key:bytes)->AESGCM:
+    return AESGCM(key)
+
 class EncryptionHandler:
     def __init__(self):
         self.iterations = 480_000
@@ -16,29 +68,56 @@ class EncryptionHandler:
         return os.urandom(16)
 
     def hash_password(self, password:str)->bytes:
-        return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+        if PASSWORD_KDF == "argon2id":
+            return password_hasher.hash(password).encode("utf-8")
+        return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_COST))
 
-    def verify_password(self, password:str, stored_hash:str)->bool:
+    def verify_password(self, password:str, stored_hash:bytes)->bool:
+        if stored_hash.startswith(ARGON2_PREFIX):
+            try:
+                return password_hasher.verify(stored_hash.decode("utf-8"), password)
+            except (VerifyMismatchError, InvalidHashError):
+                return False
         return bcrypt.checkpw(password.encode("utf-8"), stored_hash)
 
     def gen_uuid(self, username:str, hashed_password:bytes, salt:bytes)->str:
         combined = username.encode('utf-8') + hashed_password + salt
-        return hashlib.sha256(combined).hexdigest()
+        # Identity only, not security: BLAKE2b is faster than SHA-256 and keeps
+        # the 64-character hex format. Existing UUIDs are stored, never recomputed.
+        return hashlib.blake2b(combined, digest_size=32).hexdigest()
 
-    def derive_key(self, password:bytes, salt:bytes)->bytes:
-        kdf = PBKDF2HMAC(
+    def derive_key(self, username:str, salt:bytes)->bytes:
+        hkdf = HKDF(
             algorithm=hashes.SHA256(),
             length=32,
-            salt=salt,
-            iterations=self.iterations,
+            salt=bytes(salt),
+            info=HKDF_INFO_PREFIX + username.encode('utf-8'),
             backend=self.backend
         )
-        return base64.urlsafe_b64encode(kdf.derive(password))
+        return hkdf.derive(MASTER_KEY)
+
+    def derive_legacy_key(self, password:bytes, salt:bytes)->bytes:
+        return _derive_legacy_key_cached(bytes(password), bytes(salt), self.iterations)
 
     def encrypt_data(self, key:bytes, data:str)->bytes:
-        f = Fernet(key)
-        return f.encrypt(data.encode('utf-8'))
+        nonce = os.urandom(NONCE_SIZE)
+        ciphertext = _get_cipher(key).encrypt(nonce, data.encode('utf-8'), None)
+        return AESGCM_VERSION + nonce + ciphertext
 
-    def decrypt_data(self, key:bytes, encrypted_data:bytes)->str:
-        f = Fernet(key)
-        return f.decrypt(encrypted_data).decode('utf-8')
\ No newline at end of file
+    def decrypt_data(self, key:bytes, encrypted_data:bytes, password:bytes = None, salt:bytes = None)->str:
+        """
+        password and salt are only used for documents encrypted with the
+        older PBKDF2-derived key.
+        """
+        version = encrypted_data[:1]
+        if version != AESGCM_VERSION:
+            if password is None or salt is None:
+                raise ValueError("Document uses a legacy key; password hash and salt are required")
+            key = self.derive_legacy_key(password, salt)
+            if version != AESGCM_PBKDF2_VERSION:
+                # Documents written before the switch to AES-GCM are Fernet tokens
+                f = Fernet(base64.urlsafe_b64encode(key))
+                return f.decrypt(encrypted_data).decode('utf-8')
+        nonce = encrypted_data[1:1 + NONCE_SIZE]
+        ciphertext = encrypted_data[1 + NONCE_SIZE:]
+        return _get_cipher(key).decrypt(nonce, ciphertext, None).decode('utf-8')
\ No newline at end of file
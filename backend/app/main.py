@@ -4,12 +4,12 @@ from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from datetime import timedelta, datetime
-import os, shutil, faiss, numpy as np, io
-from sentence_transformers import SentenceTransformer
+import os, numpy as np, io
 
-from app import models, schemas, crud, db, utils, classifier
-from app.crud import LogCRUD, DocsCRUD
+from app import models, schemas, crud, db, utils, classifier, embedding
+from app.crud import LogWriter, DocsCRUD
 from app.encryption_logic import EncryptionHandler
+from app.vector_store import VectorStore
 from app.auth_logic import create_access_token, get_current_user, ACCESS_TOKEN_EXPIRE_MINUTES
 
 # -----------------------------
@@ -17,6 +17,11 @@ from app.auth_logic import create_access_token, get_current_user, ACCESS_TOKEN_E
 # -----------------------------
 # DB tables
 models.Base.metadata.create_all(bind=db.engine)
+db.migrate_schema()
+
+# Seed the known-author matcher with authors already in the database
+with db.SessionLocal() as session:
+    utils.add_known_authors(crud.DocsCRUD(session).fetch_authors())
 
 # FastAPI app
 app = FastAPI(title="AI Document Backend", version="1.0.0")
@@ -36,22 +41,56 @@ encryption = EncryptionHandler()
 UPLOAD_DIR = "uploaded_docs"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-search_model = SentenceTransformer('all-MiniLM-L6-v2')
-documents_index = faiss.IndexFlatL2(384)
-docid_map = {}
+search_model = embedding.load_search_model()
+EMBEDDING_BATCH_SIZE = 32
 
 FAISS_INDEX_PATH = "faiss.index"
 DOCID_MAP_PATH = "docid_map.npy"
+VECTORS_PATH = "vectors.bin"
+VECTOR_IDS_PATH = "vector_ids.bin"
+
+vector_store = VectorStore(
+    vectors_path=VECTORS_PATH,
+    ids_path=VECTOR_IDS_PATH,
+    index_path=FAISS_INDEX_PATH,
+    legacy_docid_map_path=DOCID_MAP_PATH
+)
+
+def embed_texts(texts: list[str]) -> np.ndarray:
+    """
+    Encodes a batch of texts in one model call. FAISS expects float32 input;
+    VectorStore takes care of normalization.
+    """
+    embeddings = search_model.encode(
+        texts,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        convert_to_numpy=True
+    )
+    return embeddings.astype(np.float32)
+
+# Roles that may read every document in their own category
+DEPARTMENT_ROLES = frozenset({"hr", "finance", "legal"})
+
+def can_read_document(user: models.User, doc: models.Document) -> bool:
+    user_role = user.role.lower()
+    return (doc.uuid == user.uuid or
+            user_role == "admin" or
+            (user_role in DEPARTMENT_ROLES and doc.category_lower == user_role))
+
+# Access logs are written in batches by a background thread
+log_writer = LogWriter(db.SessionLocal)
 
-if os.path.exists(FAISS_INDEX_PATH):
-    print("Loading FAISS index from disk...")
-    documents_index = faiss.read_index(FAISS_INDEX_PATH)
-    docid_map = np.load(DOCID_MAP_PATH, allow_pickle=True).item()
-else:
-    print("Creating new FAISS index...")
-    search_model = SentenceTransformer('all-MiniLM-L6-v2')
-    documents_index = faiss.IndexFlatL2(384)
-    docid_map = {}
+@app.on_event("startup")
+def start_log_writer():
+    log_writer.start()
+
+@app.on_event("shutdown")
+def flush_vector_store():
+    vector_store.flush()
+
+@app.on_event("shutdown")
+def stop_log_writer():
+    log_writer.stop()
 
 def get_user_crud(db: Session = Depends(db.get_db)):
     return crud.UserCRUD(db)
@@ -59,9 +98,6 @@ def get_user_crud(db: Session = Depends(db.get_db)):
 def get_docs_crud(db: Session = Depends(db.get_db)):
     return crud.DocsCRUD(db)
 
-def get_log_crud(db: Session = Depends(db.get_db)):
-    return LogCRUD(db)
-
 @app.get("/")
 def root():
     return {"message": "Backend is running", "version": "1.0.0"}
@@ -117,41 +153,30 @@ def read_users_me(current_user: models.User = Depends(get_current_user)):
 def upload_document(
     file: UploadFile = File(...),
     db: Session = Depends(db.get_db),
-    current_user: models.User = Depends(get_current_user),
-    log_crud: LogCRUD = Depends(get_log_crud)
+    current_user: models.User = Depends(get_current_user)
 ):
-    
+
     allowed_file_types = ["application/pdf", "application/vnd.openxmlformats-officedocument.wordprocessingml.document", "text/plain"]
     if file.content_type not in allowed_file_types:
         raise HTTPException(status_code=400, detail="Unsupported file type. Please upload a PDF, DOCX, or TXT file.")
 
-    # 1. Save the file temporarily
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    # 2. Extract content, classify, and summarize
+    # 1-2. Extract content straight from the upload stream, classify, and
+    # summarize. The plaintext is never written to disk.
     try:
-        document_content = utils.extract_text_from_file(file_path)
-        category = classifier.classify_document(document_content)
+        # Read the upload once; classify page by page while assembling the text
+        pages = list(utils.iter_pages(file.file, file.filename))
+        category = classifier.classify_chunks(pages)
+        document_content = "".join(pages).strip()
         metadata = utils.extract_metadata(document_content)
         summary = utils.extractive_summarization(document_content)
 
     except Exception as e:
-        # Clean up the temporary file if processing fails
-        if os.path.exists(file_path):
-            os.remove(file_path)
         raise HTTPException(status_code=400, detail=f"Error processing document: {str(e)}")
-
-    finally:
-        # Clean up the temporary unencrypted file
-        if os.path.exists(file_path):
-            os.remove(file_path)
     
     # 3. Encrypt and save the document
-    key = encryption.derive_key(current_user.hashed_password, current_user.salt)
+    key = encryption.derive_key(current_user.username, current_user.salt)
     encrypted_data = encryption.encrypt_data(key, document_content)
-    enc_path = f"{file_path}.enc"
+    enc_path = f"{os.path.join(UPLOAD_DIR, file.filename)}.enc"
     with open(enc_path, "wb") as f:
         f.write(encrypted_data)
 
@@ -165,20 +190,17 @@ def upload_document(
         author=metadata["author"] or current_user.username,
         summary=summary
     )
+    # Only authors found in the document, never the username fallback
+    utils.add_known_authors([metadata["author"]])
 
     # 5. Index document for search
     try:
-        embedding = search_model.encode(document_content)
-        documents_index.add(np.expand_dims(embedding, axis=0))
-        docid_map[documents_index.ntotal - 1] = new_doc.docid
-
-        # Save index to disk
-        faiss.write_index(documents_index, FAISS_INDEX_PATH)
-        np.save(DOCID_MAP_PATH, docid_map)
+        embeddings = embed_texts([document_content])
+        vector_store.add(embeddings, [new_doc.docid])
     except Exception as e:
         print(f"Warning: Failed to index document: {str(e)}")
 
-    log_crud.log_action(current_user.uuid, "upload", str(new_doc.docid))
+    log_writer.log_action(current_user.uuid, "upload", str(new_doc.docid))
     return new_doc
 
 
@@ -195,9 +217,9 @@ def list_documents(
     if current_user.role.lower() == "admin":
         # Admins can view all documents
         return docs_crud.fetch_all_docs(skip=skip, limit=limit)
-    elif current_user.role.lower() in ["hr", "finance", "legal"]:
+    elif current_user.role.lower() in DEPARTMENT_ROLES:
         # Specific roles can only see documents in their category
-        return docs_crud.fetch_docs_by_role(current_user.role.title())
+        return docs_crud.fetch_docs_by_role(current_user.role)
     else:
         # General users can only see documents they uploaded
         return docs_crud.fetch_docs_by_user_id(current_user.uuid)
@@ -207,8 +229,7 @@ def list_documents(
 def get_document(
     docid: int,
     db: Session = Depends(db.get_db),
-    current_user: models.User = Depends(get_current_user),
-    log_crud: LogCRUD = Depends(get_log_crud)
+    current_user: models.User = Depends(get_current_user)
 ):
     docs_crud = crud.DocsCRUD(db)
     doc = docs_crud.fetch_doc_by_doc_id(docid)
@@ -217,20 +238,19 @@ def get_document(
         raise HTTPException(status_code=404, detail="Document not found")
     
     # Check permissions
-    user_role = current_user.role.lower()
-    if not (doc.uuid == current_user.uuid or 
-            user_role == "admin" or 
-            (user_role in ["hr", "finance", "legal"] and doc.category.lower() == user_role)):
+    if not can_read_document(current_user, doc):
         raise HTTPException(status_code=403, detail="Access denied")
 
     # Decrypt and return document details
     try:
-        key = encryption.derive_key(current_user.hashed_password, current_user.salt)
+        key = encryption.derive_key(current_user.username, current_user.salt)
         with open(doc.filepath, "rb") as f:
             encrypted_data = f.read()
-        decrypted_data = encryption.decrypt_data(key, encrypted_data)
+        decrypted_data = encryption.decrypt_data(
+            key, encrypted_data, current_user.hashed_password, current_user.salt
+        )
         
-        log_crud.log_action(current_user.uuid, "view", str(doc.docid))
+        log_writer.log_action(current_user.uuid, "view", str(doc.docid))
 
         return {
             "docid": doc.docid,
@@ -249,8 +269,7 @@ def get_document(
 def download_document(
     docid: int,
     db: Session = Depends(db.get_db),
-    current_user: models.User = Depends(get_current_user),
-    log_crud: LogCRUD = Depends(get_log_crud)
+    current_user: models.User = Depends(get_current_user)
 ):
     docs_crud = crud.DocsCRUD(db)
     doc = docs_crud.fetch_doc_by_doc_id(docid)
@@ -259,19 +278,18 @@ def download_document(
         raise HTTPException(status_code=404, detail="Document not found")
     
     # Check permissions
-    user_role = current_user.role.lower()
-    if not (doc.uuid == current_user.uuid or 
-            user_role == "admin" or 
-            (user_role in ["hr", "finance", "legal"] and doc.category.lower() == user_role)):
+    if not can_read_document(current_user, doc):
         raise HTTPException(status_code=403, detail="Access denied")
 
     try:
-        key = encryption.derive_key(current_user.hashed_password, current_user.salt)
+        key = encryption.derive_key(current_user.username, current_user.salt)
         with open(doc.filepath, "rb") as f:
             encrypted_data = f.read()
-        decrypted_data = encryption.decrypt_data(key, encrypted_data)
+        decrypted_data = encryption.decrypt_data(
+            key, encrypted_data, current_user.hashed_password, current_user.salt
+        )
         
-        log_crud.log_action(current_user.uuid, "download", str(doc.docid))
+        log_writer.log_action(current_user.uuid, "download", str(doc.docid))
         
         # Create file stream
         file_stream = io.BytesIO(decrypted_data.encode('utf-8'))
@@ -310,48 +328,47 @@ def semantic_search(
     query: str, 
     limit: int = 10,
     db: Session = Depends(db.get_db),
-    current_user: models.User = Depends(get_current_user),
-    log_crud: LogCRUD = Depends(get_log_crud)
+    current_user: models.User = Depends(get_current_user)
 ):
     if not query.strip():
         raise HTTPException(status_code=400, detail="Search query cannot be empty")
 
     docs_crud = crud.DocsCRUD(db)
-    log_crud.log_action(current_user.uuid, "search")
+    log_writer.log_action(current_user.uuid, "search")
 
     try:
         # 1. Get embedding for the query
-        query_embedding = search_model.encode(query)
-        query_embedding_np = np.expand_dims(query_embedding, axis=0)
+        query_embedding_np = embed_texts([query])
         
         # 2. Search the FAISS index for similar documents
-        if documents_index.ntotal == 0:
+        if vector_store.ntotal == 0:
             return []
             
-        k = min(limit, documents_index.ntotal)
-        distances, indices = documents_index.search(query_embedding_np, k)
+        k = min(limit, vector_store.ntotal)
+        distances, indices = vector_store.search(query_embedding_np, k)
         
         # 3. Retrieve documents from the database based on search results
+        # FAISS returns -1 for empty results; skip those and unmapped indices
+        hits = [
+            (vector_store.docid_map[index], distances[0][i])
+            for i, index in enumerate(indices[0])
+            if index != -1 and index in vector_store.docid_map
+        ]
+        docs_by_id = {
+            doc.docid: doc
+            for doc in docs_crud.fetch_docs_by_doc_ids([doc_id for doc_id, _ in hits])
+        }
+
         results = []
-        for i, index in enumerate(indices[0]):
-            if index == -1:  # FAISS returns -1 for empty results
-                continue
-                
-            # Check if index exists in the map
-            if index in docid_map:
-                doc_id = docid_map[index]
-                doc = docs_crud.fetch_doc_by_doc_id(doc_id)
-                
-                # Apply role-based access control to the search results
-                if doc:
-                    user_role = current_user.role.lower()
-                    if user_role == "admin" or \
-                       (user_role in ["hr", "finance", "legal"] and doc.category.lower() == user_role) or \
-                       doc.uuid == current_user.uuid:
-                        # Add relevance score
-                        doc_dict = schemas.Document.from_orm(doc).dict()
-                        doc_dict["relevance_score"] = float(1.0 / (1.0 + distances[0][i]))  # Convert distance to similarity
-                        results.append(doc_dict)
+        for doc_id, score in hits:
+            doc = docs_by_id.get(doc_id)
+
+            # Apply role-based access control to the search results
+            if doc and can_read_document(current_user, doc):
+                # Add relevance score
+                doc_dict = schemas.Document.from_orm(doc).dict()
+                doc_dict["relevance_score"] = float(score)  # Cosine similarity
+                results.append(doc_dict)
 
         # Sort by relevance score (highest first)
         results.sort(key=lambda x: x.get("relevance_score", 0), reverse=True)
@@ -366,6 +383,6 @@ def health_check():
     return {
         "status": "healthy",
         "timestamp": datetime.utcnow(),
-        "indexed_documents": documents_index.ntotal,
-        "total_mappings": len(docid_map)
+        "indexed_documents": vector_store.ntotal,
+        "total_mappings": len(vector_store.docid_map)
     }
\ No newline at end of file
@@ -11,6 +11,7 @@ class Document(Base):
     filename = Column(String, index=True)
     filepath = Column(String)
     category = Column(String)
+    category_lower = Column(String, index=True)  # for role checks without lower() per row
     author = Column(String, nullable=True)
     summary = Column(Text, nullable=True)
     upload_date = Column(DateTime, default=datetime.utcnow)
@@ -3,45 +3,92 @@ from docx import Document as DocxDocument
 import re
 import collections
 import spacy
+from flashtext import KeywordProcessor
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
+from typing import BinaryIO, Iterable, Iterator
+
+# Only NER is used, so skip the rest of the pipeline
+SPACY_DISABLED = ["tagger", "parser", "attribute_ruler", "lemmatizer"]
+
+# Title/author entities live near the top of a document
+NER_CHAR_LIMIT = 2000
+
+SENTENCE_SPLIT_RE = re.compile(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?)\s')
+AUTHOR_RE = re.compile(r'(?:Author:|By:)\s*([a-zA-Z\s]+(?:\s*<[\w\.-]+@[\w\.-]+>)?)\s*', re.IGNORECASE)
+DATE_RE = re.compile(r'\b(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{1,2},?\s+\d{4}\b', re.IGNORECASE)
 
 try:
-    nlp = spacy.load("en_core_web_sm")
+    nlp = spacy.load("en_core_web_sm", disable=SPACY_DISABLED)
 except OSError:
     print("Downloading spaCy model 'en_core_web_sm'...")
     from spacy.cli import download
     download("en_core_web_sm")
-    nlp = spacy.load("en_core_web_sm")
+    nlp = spacy.load("en_core_web_sm", disable=SPACY_DISABLED)
 
-def extract_text_from_file(file_path: str) -> str:
+# Author names found in uploaded documents. Matching them with flashtext is
+# far cheaper than spaCy NER for PERSON entities.
+known_authors = KeywordProcessor(case_sensitive=False)
+
+# Two to four title-case tokens (initials allowed), e.g. "Jane Doe", "J. R. Smith"
+AUTHOR_NAME_RE = re.compile(r"[A-Z][a-z'\-]*\.?(?: [A-Z][a-z'\-]*\.?){1,3}")
+AUTHOR_NAME_MAX_LENGTH = 60
+
+def clean_author_name(name: str | None) -> str | None:
     """
-    Extracts text content from a file based on its extension.
-    Supports .txt, .pdf, and .docx files.
+    Returns the first line of an extracted author if it looks like a name,
+    otherwise None. AUTHOR_RE can run across lines and match phrases such
+    as "by: the end of the quarter", which must not become known names.
+    """
+    lines = name.strip().splitlines() if name else []
+    if not lines:
+        return None
+    first_line = " ".join(lines[0].split())
+    if len(first_line) > AUTHOR_NAME_MAX_LENGTH or not AUTHOR_NAME_RE.fullmatch(first_line):
+        return None
+    return first_line
+
+def add_known_authors(names: Iterable[str]):
+    for name in names:
+        name = clean_author_name(name)
+        if name:
+            known_authors.add_keyword(name, (name, "PERSON"))
+
+def iter_pages(file_obj: BinaryIO, filename: str) -> Iterator[str]:
+    """
+    Yields the text of a binary file object one page (PDF) or paragraph
+    (DOCX) at a time, choosing the format from the filename's extension.
+    Plain text files are yielded whole.
     """
-    file_extension = file_path.split('.')[-1].lower()
-    text = ""
+    file_extension = filename.split('.')[-1].lower()
 
     if file_extension == 'txt':
-        with open(file_path, 'r', encoding='utf-8') as f:
-            text = f.read()
+        text = file_obj.read().decode('utf-8')
+        # Normalize newlines the way text-mode open() does
+        yield text.replace('\r\n', '\n').replace('\r', '\n')
     elif file_extension == 'pdf':
-        with open(file_path, 'rb') as f:
-            reader = PyPDF2.PdfReader(f)
-            for page in reader.pages:
-                text += page.extract_text()
+        reader = PyPDF2.PdfReader(file_obj)
+        for page in reader.pages:
+            # Image-only pages have no text layer
+            yield page.extract_text() or ""
     elif file_extension == 'docx':
-        doc = DocxDocument(file_path)
+        doc = DocxDocument(file_obj)
         for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-    
-    return text.strip()
+            yield paragraph.text + "\n"
+
+def extract_text_from_file(file_path: str) -> str:
+    """
+    Extracts text content from a file based on its extension.
+    Supports .txt, .pdf, and .docx files.
+    """
+    with open(file_path, 'rb') as f:
+        return "".join(iter_pages(f, file_path)).strip()
 
 # New function for metadata extraction
 def extract_metadata(text: str) -> dict:
     """
-    Extracts title, author, date, and entities using regex and spaCy.
+    Extracts title, author, date, and entities using regex, known-name
+    matching, and spaCy (skipped when a known name matches).
     """
     metadata = {
         "title": "Untitled Document",
@@ -51,24 +98,27 @@ def extract_metadata(text: str) -> dict:
     }
     
     # 1. Extract Title: First line/sentence
-    first_sentence_match = re.split(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?)\s', text, 1)
+    first_sentence_match = SENTENCE_SPLIT_RE.split(text, 1)
     if first_sentence_match:
         metadata["title"] = first_sentence_match[0].strip()
     
     # 2. Extract Author: Look for "Author:", "By:", emails
-    author_match = re.search(r'(?:Author:|By:)\s*([a-zA-Z\s]+(?:\s*<[\w\.-]+@[\w\.-]+>)?)\s*', text, re.IGNORECASE)
+    author_match = AUTHOR_RE.search(text)
     if author_match:
         metadata["author"] = author_match.group(1).strip()
         
     # 3. Extract Date: Common date formats
-    date_match = re.search(r'\b(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{1,2},?\s+\d{4}\b', text, re.IGNORECASE)
+    date_match = DATE_RE.search(text)
     if date_match:
         metadata["date"] = date_match.group(0).strip()
         
-    # 4. Extract Entities: Use spaCy
-    doc = nlp(text)
-    entities = [(ent.text, ent.label_) for ent in doc.ents if ent.label_ in ["PERSON", "ORG", "MONEY"]]
-    metadata["entities"] = entities
+    # 4. Extract Entities: Known authors first; spaCy NER only when none matched
+    head = text[:NER_CHAR_LIMIT]
+    entities = known_authors.extract_keywords(head)
+    if not entities:
+        doc = nlp(head)
+        entities = [(ent.text, ent.label_) for ent in doc.ents if ent.label_ in ["PERSON", "ORG", "MONEY"]]
+    metadata["entities"] = list(dict.fromkeys(entities))
 
     return metadata
 
@@ -77,19 +127,28 @@ def extractive_summarization(text: str, num_sentences: int = 3) -> str:
     """
     Generates an extractive summary using TF-IDF and cosine similarity.
     """
-    sentences = re.split(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?)\s', text)
+    sentences = SENTENCE_SPLIT_RE.split(text)
     if len(sentences) <= num_sentences:
         return " ".join(sentences)
         
-    vectorizer = TfidfVectorizer()
-    tfidf_matrix = vectorizer.fit_transform(sentences)
+    vectorizer = TfidfVectorizer(max_features=5000, norm='l2', sublinear_tf=True, stop_words='english')
+    try:
+        tfidf_matrix = vectorizer.fit_transform(sentences)
+    except ValueError:
+        # Every sentence is only stop words (empty vocabulary)
+        return " ".join(sentences[:num_sentences])
+
+    # A first sentence of only stop words scores everything 0, so ranking
+    # would be arbitrary; keep the opening sentences instead
+    if tfidf_matrix[0].nnz == 0:
+        return " ".join(sentences[:num_sentences])
     
-    # Calculate similarity with the first sentence (as a proxy for key topic)
-    sentence_scores = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix)
+    # Rows are L2-normalized, so a sparse dot product with the first sentence
+    # (as a proxy for key topic) is already the cosine similarity
+    sentence_scores = (tfidf_matrix @ tfidf_matrix[0].T).toarray().ravel()
     
-    # Rank and select top sentences
-    ranked_sentences = np.argsort(sentence_scores[0])[::-1]
-    top_indices = sorted(ranked_sentences[:num_sentences])
+    # Select top sentences without fully sorting, then restore document order
+    top_indices = sorted(np.argpartition(-sentence_scores, num_sentences)[:num_sentences])
     
     summary = " ".join([sentences[i] for i in top_indices])
     return summary
\ No newline at end of file
@@ -0,0 +1,319 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import faiss
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; the in-process lock still applies
+    fcntl = None
+
+EMBEDDING_DIM = 384
+
+# Below this size a brute-force scan is cheap; above it, switch to HNSW
+HNSW_THRESHOLD = 10_000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+# Snapshot the FAISS index after this many inserts
+INDEX_FLUSH_INTERVAL = 100
+
+# Past this size CPU search is memory-bandwidth-bound; mirror to GPU if present
+GPU_THRESHOLD = 100_000
+# Largest k supported by FAISS GPU brute-force search
+GPU_MAX_K = 2048
+# Single GPU queries are dominated by launch overhead, so coalesce
+# concurrent searches arriving within this window
+SEARCH_BATCH_WINDOW = 0.005
+SEARCH_BATCH_MAX = 64
+
+def build_index(dim: int = EMBEDDING_DIM):
+    # Vectors are L2-normalized, so inner product is cosine similarity.
+    # FP16 storage halves the memory read per search.
+    return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.array(vectors, dtype=np.float32, order="C")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def needs_hnsw(index) -> bool:
+    return index.ntotal >= HNSW_THRESHOLD and not isinstance(index, faiss.IndexHNSW)
+
+def build_hnsw_index(vectors: np.ndarray, metric_type):
+    """
+    Builds an HNSW index over vectors, added in order so positions in
+    docid_map stay valid.
+    """
+    hnsw_index = faiss.IndexHNSWFlat(vectors.shape[1], HNSW_M, metric_type)
+    hnsw_index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    hnsw_index.hnsw.efSearch = HNSW_EF_SEARCH
+    hnsw_index.add(vectors)
+    return hnsw_index
+
+def maybe_upgrade_index(index):
+    """
+    Rebuilds a flat index as HNSW once it grows past HNSW_THRESHOLD.
+    """
+    if not needs_hnsw(index):
+        return index
+    print(f"Rebuilding FAISS index as HNSW ({index.ntotal} vectors)...")
+    return build_hnsw_index(index.reconstruct_n(0, index.ntotal), index.metric_type)
+
+def gpu_available() -> bool:
+    return hasattr(faiss, "StandardGpuResources") and faiss.get_num_gpus() > 0
+
+class SearchBatcher:
+    """
+    Coalesces concurrent searches into one batched call to search_fn.
+    Callers block until their slice of the batch result is ready.
+    """
+    def __init__(self, search_fn, window: float = SEARCH_BATCH_WINDOW, max_batch: int = SEARCH_BATCH_MAX):
+        self.search_fn = search_fn
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="search-batcher", daemon=True)
+        self.thread.start()
+
+    def search(self, query_embeddings: np.ndarray, k: int):
+        future = Future()
+        self.queue.put((query_embeddings, k, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            # Any failure is handed to the waiting callers; the thread must
+            # keep running or every later search blocks forever
+            try:
+                queries = np.concatenate([query for query, _, _ in batch])
+                k = max(query_k for _, query_k, _ in batch)
+                distances, indices = self.search_fn(queries, k)
+
+                row = 0
+                for query, query_k, future in batch:
+                    rows = slice(row, row + len(query))
+                    future.set_result((distances[rows, :query_k], indices[rows, :query_k]))
+                    row += len(query)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+class VectorStore:
+    """
+    Append-only persistence for document embeddings.
+
+    Each insert appends one float32 row to the vectors file and one int64
+    docid to the ids file. The FAISS index is only snapshotted every
+    INDEX_FLUSH_INTERVAL inserts (and on shutdown); on startup the snapshot
+    is loaded and any rows appended after it are replayed from the log.
+
+    The store owns L2 normalization of both stored and query vectors, so its
+    inner-product scores are always cosine similarities.
+    """
+    def __init__(self, vectors_path: str, ids_path: str, index_path: str,
+                 legacy_docid_map_path: str | None = None, dim: int = EMBEDDING_DIM):
+        self.vectors_path = vectors_path
+        self.ids_path = ids_path
+        self.index_path = index_path
+        self.dim = dim
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.upgrading = False
+        self.gpu_resources = None
+        self.gpu_index = None
+        self.batcher = None
+
+        if (not os.path.exists(self.vectors_path) and legacy_docid_map_path
+                and os.path.exists(legacy_docid_map_path) and os.path.exists(self.index_path)):
+            self._migrate_legacy(legacy_docid_map_path)
+
+        self.index, self.docid_map = self._load()
+        self._maybe_enable_gpu()
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    def _migrate_legacy(self, docid_map_path: str):
+        # Older deployments stored the whole index plus a pickled dict
+        print("Migrating FAISS index to append-only vector log...")
+        index = faiss.read_index(self.index_path)
+        docid_map = np.load(docid_map_path, allow_pickle=True).item()
+        vectors = index.reconstruct_n(0, index.ntotal)
+        ids = np.array([docid_map.get(i, -1) for i in range(index.ntotal)], dtype=np.int64)
+        self._append_log(vectors, ids)
+
+    def _read_log(self):
+        if not os.path.exists(self.vectors_path) or not os.path.exists(self.ids_path):
+            return np.empty((0, self.dim), dtype=np.float32), np.empty(0, dtype=np.int64)
+
+        row_bytes = self.dim * np.dtype(np.float32).itemsize
+        id_bytes = np.dtype(np.int64).itemsize
+        n = min(os.path.getsize(self.vectors_path) // row_bytes,
+                os.path.getsize(self.ids_path) // id_bytes)
+
+        # Drop a torn trailing write so later appends stay row-aligned
+        for path, size in ((self.vectors_path, n * row_bytes), (self.ids_path, n * id_bytes)):
+            if os.path.getsize(path) != size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+        if n == 0:
+            return np.empty((0, self.dim), dtype=np.float32), np.empty(0, dtype=np.int64)
+        vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+        ids = np.memmap(self.ids_path, dtype=np.int64, mode="r", shape=(n,))
+        return vectors, ids
+
+    def _load(self):
+        vectors, ids = self._read_log()
+
+        index = None
+        if os.path.exists(self.index_path):
+            print("Loading FAISS index from disk...")
+            index = faiss.read_index(self.index_path)
+            if index.ntotal > len(ids) or index.metric_type != faiss.METRIC_INNER_PRODUCT:
+                # Snapshot is ahead of the log or predates normalized
+                # embeddings; rebuild it from the log
+                index = None
+        if index is None:
+            print("Creating new FAISS index...")
+            index = build_index(self.dim)
+
+        if len(ids) > index.ntotal:
+            # Rows logged before the switch to inner product are unnormalized
+            index.add(normalize(vectors[index.ntotal:]))
+
+        if needs_hnsw(index):
+            index = maybe_upgrade_index(index)
+            # Persist once so the next startup doesn't rebuild again
+            self._write_snapshot(index)
+        if isinstance(index, faiss.IndexHNSW):
+            # efSearch is not persisted with the index
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+
+        docid_map = {i: int(docid) for i, docid in enumerate(ids) if docid >= 0}
+        return index, docid_map
+
+    def _maybe_enable_gpu(self):
+        """
+        Mirrors the index to GPU once it is large enough for GPU bandwidth to
+        pay off. HNSW has no GPU implementation, so the mirror is a flat
+        inner-product index; the CPU index keeps serving as the source of truth.
+        """
+        if self.gpu_index is not None or self.index.ntotal < GPU_THRESHOLD or not gpu_available():
+            return
+        print(f"Mirroring FAISS index to GPU ({self.index.ntotal} vectors)...")
+        flat_index = faiss.IndexFlatIP(self.dim)
+        flat_index.add(self.index.reconstruct_n(0, self.index.ntotal))
+        self.gpu_resources = faiss.StandardGpuResources()
+        self.gpu_index = faiss.index_cpu_to_gpu(self.gpu_resources, 0, flat_index)
+        self.batcher = SearchBatcher(self._search_gpu)
+
+    def _append_log(self, vectors: np.ndarray, ids: np.ndarray):
+        with open(self.vectors_path, "ab") as vf, open(self.ids_path, "ab") as idf:
+            if fcntl:
+                fcntl.flock(vf, fcntl.LOCK_EX)
+            try:
+                vf.write(vectors.tobytes())
+                idf.write(ids.tobytes())
+                vf.flush()
+                idf.flush()
+            finally:
+                if fcntl:
+                    fcntl.flock(vf, fcntl.LOCK_UN)
+
+    def add(self, embeddings: np.ndarray, docids: list[int]):
+        embeddings = normalize(embeddings)
+        ids = np.asarray(docids, dtype=np.int64)
+        with self.lock:
+            self._append_log(embeddings, ids)
+            start = self.index.ntotal
+            self.index.add(embeddings)
+            if self.gpu_index is not None:
+                self.gpu_index.add(embeddings)
+            for offset, docid in enumerate(ids):
+                self.docid_map[start + offset] = int(docid)
+            self._maybe_enable_gpu()
+
+            self.pending += len(ids)
+            if self.pending >= INDEX_FLUSH_INTERVAL:
+                self._flush()
+
+            upgrade = needs_hnsw(self.index) and not self.upgrading
+            if upgrade:
+                self.upgrading = True
+
+        if upgrade:
+            threading.Thread(target=self._upgrade_to_hnsw, name="hnsw-upgrade", daemon=True).start()
+
+    def _upgrade_to_hnsw(self):
+        """
+        Rebuilds the index as HNSW in the background. The build takes seconds,
+        so it runs without the lock while searches and uploads keep using the
+        flat index; rows added meanwhile are caught up before the swap.
+        """
+        try:
+            with self.lock:
+                start_total = self.index.ntotal
+                vectors = self.index.reconstruct_n(0, start_total)
+                metric_type = self.index.metric_type
+
+            print(f"Rebuilding FAISS index as HNSW ({start_total} vectors)...")
+            hnsw_index = build_hnsw_index(vectors, metric_type)
+
+            with self.lock:
+                if self.index.ntotal > start_total:
+                    hnsw_index.add(self.index.reconstruct_n(start_total, self.index.ntotal - start_total))
+                self.index = hnsw_index
+                # Persist once so a restart doesn't repeat the rebuild
+                self._flush()
+        except Exception as e:
+            print(f"Warning: Failed to rebuild FAISS index as HNSW: {str(e)}")
+        finally:
+            with self.lock:
+                self.upgrading = False
+
+    def search(self, query_embeddings: np.ndarray, k: int):
+        # Normalized here, as in add(), so scores are cosine similarities
+        # whatever the caller passes in
+        query_embeddings = normalize(query_embeddings)
+        if self.batcher is not None and k <= GPU_MAX_K:
+            return self.batcher.search(query_embeddings, k)
+        with self.lock:
+            return self.index.search(query_embeddings, k)
+
+    def _search_gpu(self, query_embeddings: np.ndarray, k: int):
+        with self.lock:
+            return self.gpu_index.search(query_embeddings, k)
+
+    def _write_snapshot(self, index):
+        tmp_path = f"{self.index_path}.tmp"
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, self.index_path)
+
+    def _flush(self):
+        self._write_snapshot(self.index)
+        self.pending = 0
+
+    def flush(self):
+        with self.lock:
+            if self.pending:
+                self._flush()